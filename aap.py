@@ -1,195 +1,522 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import sqlite3
-from io import BytesIO
+import threading
+import copy
+import csv
+import io
+import importlib.util
+import hashlib
+import logging
+import secrets
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 import bcrypt
-import plotly.express as px
-import plotly.graph_objects as go
-# import time   # uncomment if you want to add small delay after delete/save
 
-try:
-    from fpdf import FPDF
-    USE_FPDF = True
-except ImportError:
-    USE_FPDF = False
+# Slices and filtered frames share memory until written to, so the explicit
+# defensive .copy() calls are no longer needed
+pd.set_option('mode.copy_on_write', True)
+
+# fpdf and plotly are imported where they are used (PDF bases, chart builders), so pages
+# that never draw a chart or a statement don't pay ~250 ms of imports on a cold start
+USE_FPDF = importlib.util.find_spec("fpdf") is not None
+PDF_UNAVAILABLE_MSG = "PDF export needs the fpdf2 package (pip install fpdf2)."
+
+logger = logging.getLogger(__name__)
 
 
 # ─── Database Setup ────────────────────────────────────────────────────────────
+@st.cache_resource
+def get_conn():
+    # One shared connection for the whole process instead of reconnecting per query
+    conn = sqlite3.connect('loans.db', check_same_thread=False, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA mmap_size=268435456')
+    conn.execute('PRAGMA cache_size=-20000')
+    return conn
+
+
+@st.cache_resource
+def get_write_lock():
+    # Serialises writes on the shared connection across reruns and sessions
+    return threading.Lock()
+
+
+@contextmanager
+def write_transaction():
+    # BEGIN IMMEDIATE takes the write lock up front; commits on success, rolls back on error
+    conn = get_conn()
+    with get_write_lock(), conn:
+        conn.execute("BEGIN IMMEDIATE")
+        yield conn
+
+
+BCRYPT_ROUNDS = 10
+
+
+@st.cache_resource
+def get_login_cache():
+    # Shared by every session, so user changes made from Admin Controls can invalidate it
+    return {}
+
+LOAN_COLUMNS = ['id','sn','names','date','amount','int_rate','duration','admin_fees','interest','penalty_charged','total','g_total','amt_remitted','balance']
+# Column types the readers hand back for a populated table (Arrow-backed, see
+# _read_loans), so empty frames look the same
+LOAN_DTYPES = {'id': 'int64[pyarrow]', 'sn': 'int64[pyarrow]', 'names': 'string[pyarrow]',
+               'date': 'datetime64[ns]', 'amount': 'double[pyarrow]', 'int_rate': 'double[pyarrow]',
+               'duration': 'int64[pyarrow]', 'admin_fees': 'double[pyarrow]', 'interest': 'double[pyarrow]',
+               'penalty_charged': 'double[pyarrow]', 'total': 'double[pyarrow]', 'g_total': 'double[pyarrow]',
+               'amt_remitted': 'double[pyarrow]', 'balance': 'double[pyarrow]'}
+LEDGER_DTYPES = {'id': 'int64[pyarrow]', 'category': 'string[pyarrow]', 'amount': 'double[pyarrow]',
+                 'date': 'datetime64[ns]', 'description': 'string[pyarrow]'}
+# Columns the Edit Loans form writes back, in the order the form assigns them
+EDITABLE_LOAN_COLUMNS = ['names', 'date', 'amount', 'int_rate', 'duration', 'admin_fees', 'amt_remitted',
+                         'interest', 'penalty_charged', 'total', 'g_total', 'balance']
+
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS loans (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sn INTEGER UNIQUE NOT NULL,
+    names TEXT NOT NULL,
+    date TEXT,
+    amount REAL,
+    int_rate REAL,
+    duration INTEGER,
+    admin_fees REAL,
+    interest REAL,
+    penalty_charged REAL DEFAULT 0,
+    total REAL,
+    g_total REAL,
+    amt_remitted REAL DEFAULT 0,
+    balance REAL
+);
+
+CREATE TABLE IF NOT EXISTS expenses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    category TEXT NOT NULL,
+    amount REAL NOT NULL,
+    date TEXT NOT NULL,
+    description TEXT
+);
+
+CREATE TABLE IF NOT EXISTS other_income (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    category TEXT NOT NULL,
+    amount REAL NOT NULL,
+    date TEXT NOT NULL,
+    description TEXT
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+-- loans.sn and users.username already get an index from their UNIQUE constraints
+CREATE INDEX IF NOT EXISTS idx_loans_date ON loans(date);
+-- names = ? (client report) and DISTINCT names ORDER BY names (client picker)
+CREATE INDEX IF NOT EXISTS idx_loans_names ON loans(names);
+-- ORDER BY balance DESC LIMIT n (Dashboard top clients)
+CREATE INDEX IF NOT EXISTS idx_loans_balance ON loans(balance);
+CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses(date);
+CREATE INDEX IF NOT EXISTS idx_income_date ON other_income(date);
+"""
+
+
+def _apply_schema(conn):
+    # Older saves used to_sql(if_exists='replace'), which dropped the primary key.
+    # Such a table is moved aside and copied into the proper schema in the same transaction.
+    loan_info = conn.execute("PRAGMA table_info(loans)").fetchall()
+    legacy_loans = bool(loan_info) and not any(col[1] == 'id' and col[5] for col in loan_info)
+    migrate_before = "ALTER TABLE loans RENAME TO loans_legacy;" if legacy_loans else ""
+    migrate_after = ""
+    if legacy_loans:
+        data_cols = ', '.join(LOAN_COLUMNS[1:])
+        migrate_after = (f"INSERT INTO loans ({data_cols}) SELECT {data_cols} FROM loans_legacy ORDER BY sn;"
+                         "DROP TABLE loans_legacy;")
+    conn.executescript(f"BEGIN;{migrate_before}{SCHEMA_SQL}{migrate_after}COMMIT;")
+
+
+def _normalise_stored_dates(conn):
+    # Readers parse dates strictly as YYYY-MM-DD (DATE_PARSE) and range filters compare the
+    # text, so other spellings (e.g. '2024-05-01 00:00:00' from old to_sql saves) are
+    # rewritten once here instead of silently becoming NaT and dropping out of reports
+    fixes = []
+    for table in ('loans', 'expenses', 'other_income'):
+        odd = conn.execute(
+            f"SELECT id, date FROM {table} "
+            "WHERE date IS NOT NULL AND date NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'"
+        ).fetchall()
+        if not odd:
+            continue
+        parsed = pd.to_datetime(pd.Series([d for _, d in odd], dtype=object), errors='coerce', format='mixed')
+        fixed = [(ts.strftime('%Y-%m-%d'), row_id) for (row_id, _), ts in zip(odd, parsed) if pd.notna(ts)]
+        if len(fixed) < len(odd):
+            logger.warning("%d %s row(s) have a date that could not be parsed", len(odd) - len(fixed), table)
+        fixes.extend((table, fix) for fix in fixed)
+    if fixes:
+        conn.execute("BEGIN")
+        for table, fix in fixes:
+            conn.execute(f"UPDATE {table} SET date = ? WHERE id = ?", fix)
+        conn.execute("COMMIT")
+
+
+@st.cache_resource
 def init_db():
-    conn = sqlite3.connect('loans.db')
-    c = conn.cursor()
-
-    c.execute('''CREATE TABLE IF NOT EXISTS loans (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        sn INTEGER UNIQUE NOT NULL,
-        names TEXT NOT NULL,
-        date TEXT,
-        amount REAL,
-        int_rate REAL,
-        duration INTEGER,
-        admin_fees REAL,
-        interest REAL,
-        penalty_charged REAL DEFAULT 0,
-        total REAL,
-        g_total REAL,
-        amt_remitted REAL DEFAULT 0,
-        balance REAL
-    )''')
-
-    c.execute('''CREATE TABLE IF NOT EXISTS expenses (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        category TEXT NOT NULL,
-        amount REAL NOT NULL,
-        date TEXT NOT NULL,
-        description TEXT
-    )''')
-
-    c.execute('''CREATE TABLE IF NOT EXISTS other_income (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        category TEXT NOT NULL,
-        amount REAL NOT NULL,
-        date TEXT NOT NULL,
-        description TEXT
-    )''')
-
-    c.execute('''CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL,
-        created_at TEXT DEFAULT CURRENT_TIMESTAMP
-    )''')
-
-    c.execute("SELECT COUNT(*) FROM users WHERE username = 'admin'")
-    if c.fetchone()[0] == 0:
-        hashed = bcrypt.hashpw("password".encode('utf-8'), bcrypt.gensalt())
-        c.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", ("admin", hashed))
-
-    conn.commit()
-    conn.close()
-
-
-@st.cache_data(ttl=3)
-def load_loans_df():
-    conn = sqlite3.connect('loans.db')
-    df = pd.read_sql_query("SELECT * FROM loans ORDER BY sn ASC", conn)
-    conn.close()
+    # Schema, legacy migration and admin seed only need checking once per process, not every
+    # rerun. PRAGMAs (WAL, synchronous=NORMAL, mmap, cache) are applied once in get_conn().
+    conn = get_conn()
+    with get_write_lock(), conn:
+        _apply_schema(conn)
+        _normalise_stored_dates(conn)
+
+        # Only hash when the seed is actually missing; bcrypt is too slow to run every rerun
+        if conn.execute("SELECT 1 FROM users WHERE username = 'admin'").fetchone() is None:
+            hashed = bcrypt.hashpw("password".encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+            conn.execute("INSERT OR IGNORE INTO users (username, password_hash) VALUES (?, ?)", ("admin", hashed))
+
+
+@st.cache_resource
+def _last_data_version():
+    return {'value': None}
+
+
+def sync_external_changes():
+    # Loader caches are cleared by this process's own writes. PRAGMA data_version is
+    # SQLite's cheap "file changed" marker: it moves when another connection (another
+    # app process, a manual edit) commits, so the caches are dropped only then.
+    version = get_conn().execute("PRAGMA data_version").fetchone()[0]
+    seen = _last_data_version()
+    if seen['value'] is not None and seen['value'] != version:
+        _clear_db_caches()
+    seen['value'] = version
+
+
+# Dates are stored as YYYY-MM-DD; an explicit format lets pandas skip per-row inference
+DATE_PARSE = {'date': {'format': '%Y-%m-%d', 'errors': 'coerce'}}
+
+
+def _read_loans(where="", params=(), limit=None, offset=0):
+    # Arrow-backed columns: typed once at read time, and TEXT no longer becomes per-row Python objects
+    page = ""
+    if limit is not None:
+        page, params = "LIMIT ? OFFSET ?", (*params, limit, offset)
+    df = pd.read_sql_query(f"SELECT * FROM loans {where} ORDER BY sn ASC {page}", get_conn(),
+                           params=params, parse_dates=DATE_PARSE, dtype_backend='pyarrow')
     if df.empty:
-        cols = ['id','sn','names','date','amount','int_rate','duration','admin_fees','interest','penalty_charged','total','g_total','amt_remitted','balance']
-        return pd.DataFrame(columns=cols)
-    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+        return pd.DataFrame(columns=LOAN_COLUMNS).astype(LOAN_DTYPES)
     return df
 
 
-@st.cache_data(ttl=3)
-def load_expenses_df():
-    conn = sqlite3.connect('loans.db')
-    df = pd.read_sql_query("SELECT * FROM expenses ORDER BY date DESC", conn)
-    conn.close()
-    if df.empty:
-        return pd.DataFrame(columns=['id','category','amount','date','description'])
-    df['date'] = pd.to_datetime(df['date'], errors='coerce')
-    return df
+def _date_range_where(start, end):
+    # Dates are stored as YYYY-MM-DD text, so string bounds keep the date indexes usable
+    if start is None:
+        return "", ()
+    return "WHERE date BETWEEN ? AND ?", (start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'))
+
+
+@st.cache_data
+def load_loans_df(start=None, end=None):
+    return _read_loans(*_date_range_where(start, end))
+
+
+VIEW_PAGE_SIZE = 50
+PREVIEW_ROWS = 500
+
+
+@st.cache_data
+def load_loans_page(page, size=VIEW_PAGE_SIZE):
+    # One screen of View Records; pages are 1-based and ordered by sn
+    return _read_loans(limit=size, offset=(page - 1) * size)
 
 
-@st.cache_data(ttl=3)
-def load_other_income_df():
-    conn = sqlite3.connect('loans.db')
-    df = pd.read_sql_query("SELECT * FROM other_income ORDER BY date DESC", conn)
-    conn.close()
+@st.cache_data
+def search_loans(query):
+    # LIKE is case-insensitive for ASCII in SQLite; escape its wildcards so input matches literally
+    pattern = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return _read_loans("WHERE names LIKE ? ESCAPE '\\'", (f"%{pattern}%",))
+
+
+@st.cache_data
+def load_client_loans(name):
+    return _read_loans("WHERE names = ?", (name,))
+
+
+@st.cache_data
+def load_top_balances(n=15):
+    # The Dashboard bar chart only ever shows the n largest balances, so let SQLite pick them
+    return pd.read_sql_query(
+        "SELECT names, balance FROM loans ORDER BY balance DESC, sn ASC LIMIT ?", get_conn(), params=(n,)
+    )
+
+
+@st.cache_data
+def load_balance_distribution():
+    # Only loans with something outstanding feed the pie. This frame is display-only,
+    # so it can be narrowed; frames that get saved back keep full float64 precision.
+    df = pd.read_sql_query("SELECT names, balance FROM loans WHERE balance > 0 ORDER BY sn ASC", get_conn())
+    return df.astype({'names': 'category', 'balance': 'float32'})
+
+
+def _read_ledger(table, start=None, end=None):
+    # Shared reader for expenses / other_income, optionally limited to a date range
+    where, params = _date_range_where(start, end)
+    df = pd.read_sql_query(f"SELECT * FROM {table} {where} ORDER BY date DESC", get_conn(),
+                           params=params, parse_dates=DATE_PARSE, dtype_backend='pyarrow')
     if df.empty:
-        return pd.DataFrame(columns=['id','category','amount','date','description'])
-    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+        return pd.DataFrame(columns=list(LEDGER_DTYPES)).astype(LEDGER_DTYPES)
     return df
 
 
-@st.cache_data(ttl=10)
+@st.cache_data
+def load_expenses_df(start=None, end=None):
+    return _read_ledger('expenses', start, end)
+
+
+@st.cache_data
+def load_other_income_df(start=None, end=None):
+    return _read_ledger('other_income', start, end)
+
+
+@st.cache_data
+def load_client_names():
+    # Sorted distinct names for the report picker; BINARY collation matches Python's sorted()
+    rows = get_conn().execute("SELECT DISTINCT names FROM loans WHERE names IS NOT NULL ORDER BY names").fetchall()
+    return [r[0] for r in rows]
+
+
+@st.cache_data
+def load_kpis():
+    row = get_conn().execute(
+        "SELECT COUNT(*), COALESCE(SUM(amount), 0), COALESCE(SUM(balance), 0), "
+        "COALESCE(SUM(interest), 0), COALESCE(SUM(amt_remitted), 0) FROM loans"
+    ).fetchone()
+    return dict(zip(['count', 'principal', 'balance', 'interest', 'paid'], row))
+
+
+@st.cache_data
+def load_monthly_balance():
+    return pd.read_sql_query(
+        "SELECT strftime('%Y-%m', date) AS month, SUM(balance) AS balance, SUM(amount) AS amount "
+        "FROM loans GROUP BY month HAVING month IS NOT NULL ORDER BY month",
+        get_conn()
+    )
+
+
+@st.cache_data
 def load_users_df():
-    conn = sqlite3.connect('loans.db')
-    df = pd.read_sql_query("SELECT id, username, created_at FROM users ORDER BY created_at DESC", conn)
-    conn.close()
+    df = pd.read_sql_query("SELECT id, username, created_at FROM users ORDER BY created_at DESC", get_conn(),
+                           dtype_backend='pyarrow')
     return df
 
 
-def save_loans_df(df):
+def _loan_rows(df):
+    # Frame -> rows of the loan data columns (no id) as plain Python values (dates as text, NaN as NULL)
     df_save = df.copy()
     if 'date' in df_save.columns and pd.api.types.is_datetime64_any_dtype(df_save['date']):
         df_save['date'] = df_save['date'].dt.strftime('%Y-%m-%d').where(df_save['date'].notna(), None)
-    conn = sqlite3.connect('loans.db')
-    df_save.to_sql('loans', conn, if_exists='replace', index=False)
-    conn.close()
-    st.cache_data.clear()
+    df_save = df_save.reindex(columns=LOAN_COLUMNS[1:])
+    return df_save.astype(object).where(df_save.notna(), None)
+
+
+def _clear_loan_caches():
+    load_loans_df.clear()
+    load_loans_page.clear()
+    load_top_balances.clear()
+    load_balance_distribution.clear()
+    load_client_names.clear()
+    search_loans.clear()
+    load_client_loans.clear()
+    load_kpis.clear()
+    load_monthly_balance.clear()
+
+
+def _clear_db_caches():
+    # Every loader that reads loans.db. The chart memos are keyed on the frames
+    # these return, so they stay valid and are left alone.
+    _clear_loan_caches()
+    load_expenses_df.clear()
+    load_other_income_df.clear()
+    load_users_df.clear()
+
+
+def append_loans_df(new_rows):
+    # Insert only the new rows; the existing book is left untouched. Serial numbers are
+    # taken from the sn index inside the write lock, so concurrent adds can't collide.
+    data_cols = LOAN_COLUMNS[1:]
+    df_save = _loan_rows(new_rows)
+    with write_transaction() as conn:
+        sn_max = conn.execute("SELECT COALESCE(MAX(sn), 0) FROM loans").fetchone()[0]
+        sns = list(range(sn_max + 1, sn_max + 1 + len(df_save)))
+        df_save['sn'] = sns
+        conn.executemany(
+            f"INSERT INTO loans ({', '.join(data_cols)}) VALUES ({', '.join('?' * len(data_cols))})",
+            df_save.itertuples(index=False, name=None)
+        )
+    _clear_loan_caches()
+    return sns
+
+
+def update_loan(sn, values):
+    # values in EDITABLE_LOAN_COLUMNS order; one row located through the UNIQUE(sn) index
+    with write_transaction() as conn:
+        conn.execute(
+            f"UPDATE loans SET {', '.join(f'{col} = ?' for col in EDITABLE_LOAN_COLUMNS)} WHERE sn = ?",
+            (*values, sn)
+        )
+    _clear_loan_caches()
+
+
+def delete_loan(sn):
+    with write_transaction() as conn:
+        conn.execute("DELETE FROM loans WHERE sn = ?", (sn,))
+    _clear_loan_caches()
+
+
+def reset_loans():
+    # One statement in one transaction; caches are cleared only after it commits
+    with write_transaction() as conn:
+        conn.execute("DELETE FROM loans")
+    _clear_loan_caches()
+
+
+def save_expenses_bulk(rows):
+    # rows: iterable of (category, amount, date_str, description) tuples, written in one transaction
+    with write_transaction() as conn:
+        conn.executemany("INSERT INTO expenses (category, amount, date, description) VALUES (?, ?, ?, ?)", rows)
+    load_expenses_df.clear()
 
 
 def save_expense(category, amount, date_str, description=""):
-    conn = sqlite3.connect('loans.db')
-    c = conn.cursor()
-    c.execute("INSERT INTO expenses (category, amount, date, description) VALUES (?, ?, ?, ?)",
-              (category, amount, date_str, description))
-    conn.commit()
-    conn.close()
-    st.cache_data.clear()
+    save_expenses_bulk([(category, amount, date_str, description)])
+
+
+def save_other_income_bulk(rows):
+    # rows: iterable of (category, amount, date_str, description) tuples, written in one transaction
+    with write_transaction() as conn:
+        conn.executemany("INSERT INTO other_income (category, amount, date, description) VALUES (?, ?, ?, ?)", rows)
+    load_other_income_df.clear()
 
 
 def save_other_income(category, amount, date_str, description=""):
-    conn = sqlite3.connect('loans.db')
-    c = conn.cursor()
-    c.execute("INSERT INTO other_income (category, amount, date, description) VALUES (?, ?, ?, ?)",
-              (category, amount, date_str, description))
-    conn.commit()
-    conn.close()
-    st.cache_data.clear()
+    save_other_income_bulk([(category, amount, date_str, description)])
 
 
 def add_new_user(username, password):
-    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-    conn = sqlite3.connect('loans.db')
-    c = conn.cursor()
+    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
     try:
-        c.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, hashed))
-        conn.commit()
+        with write_transaction() as conn:
+            conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, hashed))
+        load_users_df.clear()
+        get_login_cache().clear()
         return True
     except sqlite3.IntegrityError:
         return False
-    finally:
-        conn.close()
 
 
 def delete_user(user_id, current_username):
-    conn = sqlite3.connect('loans.db')
-    c = conn.cursor()
-    c.execute("DELETE FROM users WHERE id = ? AND username != ? AND username != 'admin'", (user_id, current_username))
-    conn.commit()
-    conn.close()
-    st.cache_data.clear()
+    with write_transaction() as conn:
+        conn.execute("DELETE FROM users WHERE id = ? AND username != ? AND username != 'admin'", (user_id, current_username))
+    load_users_df.clear()
+    get_login_cache().clear()
+
+
+LOGIN_CACHE_SECONDS = 60
+
+
+@st.cache_resource
+def get_dummy_hash():
+    # Hash of a random throwaway secret at BCRYPT_ROUNDS; only ever checked against, never matched
+    return bcrypt.hashpw(secrets.token_bytes(16), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
 
 
 def verify_login(username, password):
-    conn = sqlite3.connect('loans.db')
-    c = conn.cursor()
-    c.execute("SELECT password_hash FROM users WHERE username = ?", (username,))
-    result = c.fetchone()
-    conn.close()
-    if result:
-        return bcrypt.checkpw(password.encode('utf-8'), result[0])
-    return False
+    # Reruns of a login-gated page re-submit the same credentials; skip bcrypt for a short
+    # while. Only successes are remembered, so a wrong password is always checked again.
+    cache = get_login_cache()
+    now = time.time()
+    # Expired entries are dropped here, so password digests don't outlive the window
+    for stale in [k for k, verified_at in list(cache.items()) if now - verified_at >= LOGIN_CACHE_SECONDS]:
+        cache.pop(stale, None)
+    key = (username, hashlib.sha256(password.encode('utf-8')).digest())
+    if key in cache:
+        return True
+    ok = _check_password(username, password)
+    if ok:
+        cache[key] = now
+    return ok
+
+
+def _check_password(username, password):
+    result = get_conn().execute("SELECT password_hash FROM users WHERE username = ?", (username,)).fetchone()
+    if not result:
+        # Same bcrypt work as a real check, so response time doesn't reveal which usernames exist
+        bcrypt.checkpw(password.encode('utf-8'), get_dummy_hash())
+        return False
+    stored = result[0]
+    ok = bcrypt.checkpw(password.encode('utf-8'), stored)
+    if ok and _bcrypt_cost(stored) < BCRYPT_ROUNDS:
+        _rehash_password(username, password)
+    return ok
+
+
+def _bcrypt_cost(hashed):
+    # $2b$<cost>$<salt+hash>
+    return int(hashed[4:6])
+
+
+def _rehash_password(username, password):
+    # Hashes weaker than BCRYPT_ROUNDS are upgraded on the next successful login. Stronger
+    # ones (e.g. bcrypt's default 12) are left alone; a login never lowers a stored cost.
+    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+    with write_transaction() as conn:
+        conn.execute("UPDATE users SET password_hash = ? WHERE username = ?", (hashed, username))
 
 
 # ─── Loan Calculations ─────────────────────────────────────────────────────────
+def _overdue_start(loan_date):
+    # The penalty clock only runs for YYYY-MM-DD text and datetimes/Timestamps. A bare
+    # datetime.date (what st.date_input returns) has always counted as not overdue, because
+    # comparing it with now() failed; charging those is a penalty-policy change, not a refactor.
+    if isinstance(loan_date, str):
+        try:
+            return datetime.strptime(loan_date, "%Y-%m-%d")
+        except ValueError:
+            return None
+    if isinstance(loan_date, datetime) and pd.notna(loan_date):
+        return loan_date
+    return None
+
+
 def months_overdue(loan_date, duration_months):
+    start = _overdue_start(loan_date)
+    if start is None:
+        return 0
     try:
-        if isinstance(loan_date, str):
-            start = datetime.strptime(loan_date, "%Y-%m-%d")
-        else:
-            start = loan_date
-        due = start + timedelta(days=int(duration_months * 30.437))
-        today = datetime.now()
-        if today <= due:
-            return 0
-        delta_days = (today - due).days
-        return delta_days // 30
-    except:
+        days = int(duration_months * 30.437)
+    except (TypeError, ValueError, OverflowError):
         return 0
+    # Whole-day datetime64 arithmetic; stored dates are midnight, so this matches now()-based days
+    due = np.datetime64(start, 'D') + np.timedelta64(days, 'D')
+    late_days = int((np.datetime64('today', 'D') - due) // np.timedelta64(1, 'D'))
+    return max(late_days, 0) // 30
+
+
+def months_overdue_vec(dates, durations):
+    # Whole-column months_overdue, with the same per-element rules as the scalar version
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates.map(_overdue_start, na_action='ignore'))
+    days = np.trunc(pd.to_numeric(durations, errors='coerce').astype(float) * 30.437)
+    due = dates + pd.to_timedelta(days, unit='D')
+    overdue = (pd.Timestamp.now() - due).dt.days // 30
+    return overdue.clip(lower=0).fillna(0).to_numpy()
 
 
 def calculate_loan_fields(amount, rate, duration, admin_fees, remitted, loan_date):
@@ -214,28 +541,106 @@ def calculate_loan_fields(amount, rate, duration, admin_fees, remitted, loan_dat
     )
 
 
-# ─── PDF Functions ─────────────────────────────────────────────────────────────
-def generate_fancy_pdf_single_client(row_or_df):
-    pdf = FPDF(orientation='P', unit='mm', format='A4')
-    pdf.add_page()
+def calculate_loan_fields_vec(df):
+    # Column-wise version of calculate_loan_fields for whole frames. The arithmetic runs on
+    # plain float64 arrays, so there is no index alignment between the intermediate steps.
+    amount = df['amount'].to_numpy(dtype=float)
+    duration = df['duration'].to_numpy(dtype=float)
+    admin_fees = df['admin_fees'].to_numpy(dtype=float)
+    remitted = df['amt_remitted'].to_numpy(dtype=float)
+
+    interest = amount * (df['int_rate'].to_numpy(dtype=float) / 100) * duration
+    overdue_months = months_overdue_vec(df['date'], df['duration'])
+    penalty = amount * 0.10 * overdue_months
+
+    provisional = amount + admin_fees + interest - remitted
+    penalty = np.where(provisional > 0, penalty, 0.0)
+
+    total_add = admin_fees + interest + penalty
+    g_total = amount + total_add
+    balance = np.maximum(g_total - remitted, 0)
+
+    return df.assign(
+        interest=interest.round(2),
+        penalty_charged=penalty.round(2),
+        total=total_add.round(2),
+        g_total=g_total.round(2),
+        balance=balance.round(2)
+    )
+
+
+# ─── CSV Export ────────────────────────────────────────────────────────────────
+def csv_bytes(df):
+    # Encodes straight into a byte buffer instead of building the str and then a bytes copy
+    buf = io.BytesIO()
+    df.to_csv(buf, index=False, encoding='utf-8')
+    return buf.getvalue()
 
+
+# ─── PDF Functions ─────────────────────────────────────────────────────────────
+@st.cache_resource
+def load_logo_bytes():
+    # Read once per process; shared by the page header and the PDF letterheads
     try:
-        pdf.image("logo.jpg", x=10, y=8, w=40)
-    except:
-        pass
+        with open("logo.jpg", "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _draw_pdf_letterhead(pdf, tagline):
+    from fpdf.errors import FPDFException
+
+    logo = load_logo_bytes()
+    if logo:
+        try:
+            pdf.image(io.BytesIO(logo), x=10, y=8, w=40)
+        except (OSError, ValueError, FPDFException) as exc:
+            # PIL raises OSError (UnidentifiedImageError) for unreadable or truncated files
+            logger.warning("Skipping logo on PDF letterhead: %s", exc)
 
     pdf.set_font("Arial", "B", 18)
     pdf.set_text_color(0, 51, 102)
     pdf.cell(0, 14, "TRUSTED FRIENDS LIMITED", ln=1, align='C')
     pdf.set_font("Arial", "I", 10)
     pdf.set_text_color(80, 80, 80)
-    pdf.cell(0, 6, "Reliable Loan Management & Financial Services", ln=1, align='C')
+    pdf.cell(0, 6, tagline, ln=1, align='C')
+
+
+# The static header (logo decode, fonts, banner) is drawn once per process;
+# generators deepcopy the cached base and only render the dynamic parts.
+@st.cache_resource
+def _base_loan_statement_pdf():
+    from fpdf import FPDF
+    pdf = FPDF(orientation='P', unit='mm', format='A4')
+    pdf.add_page()
+    _draw_pdf_letterhead(pdf, "Reliable Loan Management & Financial Services")
 
     pdf.set_fill_color(0, 102, 204)
     pdf.rect(0, 45, 210, 38, 'F')
     pdf.set_text_color(255, 255, 255)
     pdf.set_font("Arial", "B", 22)
     pdf.cell(0, 22, "LOAN STATEMENT", ln=1, align='C')
+    return pdf
+
+
+@st.cache_resource
+def _base_income_statement_pdf():
+    from fpdf import FPDF
+    pdf = FPDF(orientation='P', unit='mm', format='A4')
+    pdf.add_page()
+    _draw_pdf_letterhead(pdf, "Accurate Financial Reporting & Loan Management")
+
+    pdf.set_fill_color(0, 102, 204)
+    pdf.rect(0, 55, 210, 35, 'F')
+    pdf.set_text_color(255, 255, 255)
+    pdf.set_font("Arial", "B", 20)
+    pdf.cell(0, 18, "INCOME STATEMENT", ln=1, align='C')
+    return pdf
+
+
+def generate_fancy_pdf_single_client(row_or_df):
+    pdf = copy.deepcopy(_base_loan_statement_pdf())
     pdf.set_font("Arial", "", 11)
     pdf.cell(0, 10, f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}", ln=1, align='C')
 
@@ -246,10 +651,7 @@ def generate_fancy_pdf_single_client(row_or_df):
             pdf.set_text_color(200, 0, 0)
             pdf.set_font("Arial", "B", 14)
             pdf.cell(0, 12, "No loan record found.", ln=1, align='C')
-            buf = BytesIO()
-            pdf.output(buf)
-            buf.seek(0)
-            return buf
+            return bytes(pdf.output())
         row = row_or_df.iloc[0]
     else:
         row = row_or_df
@@ -314,33 +716,11 @@ def generate_fancy_pdf_single_client(row_or_df):
     pdf.cell(95, 8, "Chairman", 0, 0, 'L')
     pdf.cell(95, 8, "Secretary", 0, 1, 'R')
 
-    buf = BytesIO()
-    pdf.output(buf)
-    buf.seek(0)
-    return buf
+    return bytes(pdf.output())
 
 
 def generate_profit_loss_pdf(pl_data, period_text):
-    pdf = FPDF(orientation='P', unit='mm', format='A4')
-    pdf.add_page()
-
-    try:
-        pdf.image("logo.jpg", x=10, y=8, w=40)
-    except:
-        pass
-
-    pdf.set_font("Arial", "B", 18)
-    pdf.set_text_color(0, 51, 102)
-    pdf.cell(0, 14, "TRUSTED FRIENDS LIMITED", ln=1, align='C')
-    pdf.set_font("Arial", "I", 10)
-    pdf.set_text_color(80, 80, 80)
-    pdf.cell(0, 6, "Accurate Financial Reporting & Loan Management", ln=1, align='C')
-
-    pdf.set_fill_color(0, 102, 204)
-    pdf.rect(0, 55, 210, 35, 'F')
-    pdf.set_text_color(255, 255, 255)
-    pdf.set_font("Arial", "B", 20)
-    pdf.cell(0, 18, "INCOME STATEMENT", ln=1, align='C')
+    pdf = copy.deepcopy(_base_income_statement_pdf())
     pdf.set_font("Arial", "", 12)
     pdf.cell(0, 10, f"Period: {period_text}", ln=1, align='C')
     pdf.cell(0, 8, f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}", ln=1, align='C')
@@ -411,21 +791,139 @@ def generate_profit_loss_pdf(pl_data, period_text):
     pdf.cell(95, 8, "Chairman", 0, 0, 'L')
     pdf.cell(95, 8, "Secretary", 0, 1, 'R')
 
-    buf = BytesIO()
-    pdf.output(buf)
-    buf.seek(0)
-    return buf
+    return bytes(pdf.output())
+
+
+# ─── Dashboard Charts ──────────────────────────────────────────────────────────
+# Figures are memoised on their input frames, so reruns with unchanged data skip
+# the Plotly build entirely.
+@st.cache_data(show_spinner=False)
+def build_balance_trend_fig(monthly):
+    import plotly.graph_objects as go
+    fig_trend = go.Figure()
+
+    fig_trend.add_trace(
+        go.Scatter(
+            x=monthly['month'],
+            y=monthly['balance'],
+            mode='lines+markers',
+            name='Outstanding Balance',
+            fill='tozeroy',
+            fillcolor='rgba(231, 76, 60, 0.18)',
+            line=dict(color='#e74c3c', width=3),
+            marker=dict(size=8, color='#c0392b')
+        )
+    )
+
+    fig_trend.add_trace(
+        go.Scatter(
+            x=monthly['month'],
+            y=monthly['amount'],
+            mode='lines+markers',
+            name='Principal Disbursed',
+            line=dict(color='#27ae60', width=2, dash='dot'),
+            marker=dict(size=6, color='#2ecc71')
+        )
+    )
+
+    fig_trend.update_layout(
+        title="Monthly Trend: Outstanding Balance vs Disbursed Principal",
+        xaxis_title="Month",
+        yaxis_title="Amount (NGN)",
+        hovermode="x unified",
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(family="Segoe UI, Arial", size=13),
+        title_font=dict(size=22),
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+        height=550,
+        margin=dict(l=40, r=40, t=80, b=60)
+    )
+    return fig_trend
+
+
+@st.cache_data(show_spinner=False)
+def build_top_clients_fig(top):
+    import plotly.express as px
+    fig_bar = px.bar(
+        top,
+        x='names',
+        y='balance',
+        title="Top Clients by Outstanding Balance",
+        labels={'names': 'Client Name', 'balance': 'Balance Due (NGN)'},
+        color='balance',
+        color_continuous_scale='RdYlGn_r',
+        text_auto='.0f',
+        height=520
+    )
+    fig_bar.update_traces(
+        textposition='auto',
+        marker_line_color='black',
+        marker_line_width=1,
+        hovertemplate='<b>%{x}</b><br>Balance: NGN %{y:,.0f}<extra></extra>'
+    )
+    fig_bar.update_layout(
+        xaxis_title="Client Name",
+        yaxis_title="Balance Due (NGN)",
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(family="Segoe UI, Arial", size=13),
+        title_font=dict(size=22),
+        bargap=0.22,
+        showlegend=False
+    )
+    return fig_bar
+
+
+@st.cache_data(show_spinner=False)
+def build_balance_pie_fig(outstanding):
+    import plotly.express as px
+    fig_pie = px.pie(
+        outstanding,
+        values='balance',
+        names='names',
+        title="Distribution of Outstanding Balances",
+        hole=0.45,
+        color_discrete_sequence=px.colors.qualitative.Set2,
+        height=520
+    )
+    fig_pie.update_traces(
+        textposition='inside',
+        textinfo='percent+label',
+        insidetextorientation='radial',
+        hovertemplate='<b>%{label}</b><br>Balance: NGN %{value:,.0f}<br>Share: %{percent:.1%}<extra></extra>'
+    )
+    fig_pie.update_layout(
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=-0.15,
+            xanchor="center",
+            x=0.5
+        ),
+        font=dict(family="Segoe UI, Arial", size=13),
+        title_font=dict(size=22),
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)'
+    )
+    return fig_pie
 
 
 # ─── App Initialization ────────────────────────────────────────────────────────
 init_db()
+sync_external_changes()
+
+# One "today" per rerun, shared by every form default and file name below
+TODAY = datetime.today()
+TODAY_STR = TODAY.strftime("%Y-%m-%d")
 
 st.set_page_config(page_title="Loan Management", layout="wide", page_icon="💰")
 
 
 # ─── Improved CSS ──────────────────────────────────────────────────────────────
-st.markdown(
-    """
+# Emitted on every rerun on purpose: Streamlit drops any element a rerun doesn't
+# re-render, so gating this behind session_state would strip the styles after one click.
+APP_CSS = """
     <style>
         .main .block-container {
             padding-top: 2rem !important;
@@ -461,6 +959,14 @@ st.markdown(
             font-size: 1.15rem;
             animation: fadeInOut 4.5s forwards;
         }
+        .pl-grid {
+            display: grid;
+            grid-template-columns: repeat(4, minmax(0, 1fr));
+            gap: 1rem;
+            margin-bottom: 1rem;
+        }
+        .pl-grid .pl-label { font-size: 0.875rem; color: #555; }
+        .pl-grid .pl-value { font-size: 1.75rem; font-weight: 600; }
         @keyframes fadeInOut {
             0%   { opacity: 0; transform: translateY(-30px); }
             10%  { opacity: 1; transform: translateY(0); }
@@ -468,9 +974,8 @@ st.markdown(
             100% { opacity: 0; transform: translateY(-30px); }
         }
     </style>
-    """,
-    unsafe_allow_html=True
-)
+"""
+st.markdown(APP_CSS, unsafe_allow_html=True)
 
 
 # Session state initialization
@@ -517,6 +1022,11 @@ def section_login_form(section_name, session_key):
 
 def logout_button():
     if st.button("Logout", type="primary"):
+        # Logging out forgets the user's verified credentials, so the next login runs bcrypt again
+        user = st.session_state.get('current_user')
+        cache = get_login_cache()
+        for key in [k for k in list(cache) if k[0] == user]:
+            cache.pop(key, None)
         for k in list(st.session_state.keys()):
             if 'auth' in k or k == 'current_user':
                 del st.session_state[k]
@@ -547,9 +1057,8 @@ with st.sidebar:
 
     st.markdown("---")
     if st.button("Refresh Data"):
-        if 'df' in st.session_state:
-            del st.session_state.df
-        st.session_state.df = load_loans_df()
+        # Loaders are only invalidated by this app's own writes; pick up external changes too
+        _clear_db_caches()
         st.success("Data refreshed")
         st.rerun()
 
@@ -558,9 +1067,10 @@ with st.sidebar:
 col_logo, col_title = st.columns([1, 5])
 
 with col_logo:
-    try:
-        st.image("logo.jpg", width=90)
-    except FileNotFoundError:
+    logo = load_logo_bytes()
+    if logo:
+        st.image(logo, width=90)
+    else:
         st.warning("logo.jpg not found – using placeholder")
         st.image("https://via.placeholder.com/90x90?text=Logo", width=90)
 
@@ -571,15 +1081,15 @@ with col_title:
 
 # ─── Page Routing ──────────────────────────────────────────────────────────────
 if st.session_state.page == "Dashboard":
-    df = load_loans_df()
-    if not df.empty:
+    kpis = load_kpis()
+    if kpis['count'] > 0:
         st.markdown("### Key Performance Indicators")
         kpi_cols = st.columns(4)
 
-        total_principal = df['amount'].sum()
-        total_balance   = df['balance'].sum()
-        total_interest  = df['interest'].sum()
-        total_paid      = df['amt_remitted'].sum()
+        total_principal = kpis['principal']
+        total_balance   = kpis['balance']
+        total_interest  = kpis['interest']
+        total_paid      = kpis['paid']
 
         def fancy_metric(col, label, value, delta=None, color="#1f77b4"):
             with col:
@@ -613,112 +1123,15 @@ if st.session_state.page == "Dashboard":
         tab1, tab2, tab3 = st.tabs(["Balance Trend Over Time", "Outstanding by Client", "Balance Distribution"])
 
         with tab1:
-            df_trend = df.copy()
-            df_trend['month'] = df_trend['date'].dt.to_period('M').astype(str)
-            monthly_balance = df_trend.groupby('month')['balance'].sum().reset_index()
-            monthly_principal = df_trend.groupby('month')['amount'].sum().reset_index()
-
-            fig_trend = go.Figure()
-
-            fig_trend.add_trace(
-                go.Scatter(
-                    x=monthly_balance['month'],
-                    y=monthly_balance['balance'],
-                    mode='lines+markers',
-                    name='Outstanding Balance',
-                    fill='tozeroy',
-                    fillcolor='rgba(231, 76, 60, 0.18)',
-                    line=dict(color='#e74c3c', width=3),
-                    marker=dict(size=8, color='#c0392b')
-                )
-            )
-
-            fig_trend.add_trace(
-                go.Scatter(
-                    x=monthly_principal['month'],
-                    y=monthly_principal['amount'],
-                    mode='lines+markers',
-                    name='Principal Disbursed',
-                    line=dict(color='#27ae60', width=2, dash='dot'),
-                    marker=dict(size=6, color='#2ecc71')
-                )
-            )
-
-            fig_trend.update_layout(
-                title="Monthly Trend: Outstanding Balance vs Disbursed Principal",
-                xaxis_title="Month",
-                yaxis_title="Amount (NGN)",
-                hovermode="x unified",
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)',
-                font=dict(family="Segoe UI, Arial", size=13),
-                title_font=dict(size=22),
-                legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
-                height=550,
-                margin=dict(l=40, r=40, t=80, b=60)
-            )
-
+            fig_trend = build_balance_trend_fig(load_monthly_balance())
             st.plotly_chart(fig_trend, use_container_width=True, config={'displayModeBar': False})
 
         with tab2:
-            fig_bar = px.bar(
-                df.sort_values('balance', ascending=False).head(15),
-                x='names',
-                y='balance',
-                title="Top Clients by Outstanding Balance",
-                labels={'names': 'Client Name', 'balance': 'Balance Due (NGN)'},
-                color='balance',
-                color_continuous_scale='RdYlGn_r',
-                text_auto='.0f',
-                height=520
-            )
-            fig_bar.update_traces(
-                textposition='auto',
-                marker_line_color='black',
-                marker_line_width=1,
-                hovertemplate='<b>%{x}</b><br>Balance: NGN %{y:,.0f}<extra></extra>'
-            )
-            fig_bar.update_layout(
-                xaxis_title="Client Name",
-                yaxis_title="Balance Due (NGN)",
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)',
-                font=dict(family="Segoe UI, Arial", size=13),
-                title_font=dict(size=22),
-                bargap=0.22,
-                showlegend=False
-            )
+            fig_bar = build_top_clients_fig(load_top_balances())
             st.plotly_chart(fig_bar, use_container_width=True)
 
         with tab3:
-            fig_pie = px.pie(
-               df[df['balance'] > 0],
-               values='balance',
-               names='names',
-               title="Distribution of Outstanding Balances",
-               hole=0.45,
-               color_discrete_sequence=px.colors.qualitative.Set2,
-               height=520
-            )
-            fig_pie.update_traces(
-                textposition='inside',
-                textinfo='percent+label',
-                insidetextorientation='radial',
-                hovertemplate='<b>%{label}</b><br>Balance: NGN %{value:,.0f}<br>Share: %{percent:.1%}<extra></extra>'
-            )
-            fig_pie.update_layout(
-                legend=dict(
-                    orientation="h",
-                    yanchor="bottom",
-                    y=-0.15,
-                    xanchor="center",
-                    x=0.5
-                ),
-                font=dict(family="Segoe UI, Arial", size=13),
-                title_font=dict(size=22),
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)'
-            )
+            fig_pie = build_balance_pie_fig(load_balance_distribution())
             st.plotly_chart(fig_pie, use_container_width=True)
 
     else:
@@ -726,10 +1139,20 @@ if st.session_state.page == "Dashboard":
 
 
 elif st.session_state.page == "View Records":
-    df = load_loans_df()
-    if not df.empty:
+    total_loans = load_kpis()['count']
+    if total_loans > 0:
         search_name = st.text_input("Search by Client Name (optional)", "")
-        filtered = df if not search_name.strip() else df[df['names'].str.contains(search_name.strip(), case=False, na=False)]
+        if search_name.strip():
+            filtered = search_loans(search_name.strip())
+        else:
+            # Only the current page is read and sent to the browser
+            page_count = -(-total_loans // VIEW_PAGE_SIZE)
+            view_page = 1
+            if page_count > 1:
+                view_page = int(st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1))
+            filtered = load_loans_page(view_page)
+            first = (view_page - 1) * VIEW_PAGE_SIZE + 1
+            st.caption(f"Showing {first}–{first + len(filtered) - 1} of {total_loans} records")
 
         st.dataframe(
             filtered.drop(columns=['id'] if 'id' in filtered.columns else []),
@@ -758,31 +1181,33 @@ elif st.session_state.page == "Reports":
             if not df.empty:
                 st.subheader("Client Loan Report")
 
-                client_names = ["All Clients"] + sorted(df['names'].unique().tolist())
+                client_names = ["All Clients"] + load_client_names()
                 selected_client = st.selectbox("Select Client", client_names, key="client_select_report")
 
                 if selected_client == "All Clients":
                     filtered = df
                     fname_suffix = "all_clients"
                 else:
-                    filtered = df[df['names'] == selected_client]
+                    filtered = load_client_loans(selected_client)
                     fname_suffix = selected_client.replace(" ", "_").lower()
 
                 if filtered.empty:
                     st.warning("No record found.")
                 else:
                     c1, c2 = st.columns(2)
-                    today_str = datetime.now().strftime("%Y-%m-%d")
-                    fname = f"loan_report_{fname_suffix}_{today_str}"
+                    fname = f"loan_report_{fname_suffix}_{TODAY_STR}"
 
                     with c1:
-                        csv_data = filtered.drop(columns=['id'] if 'id' in filtered else []).to_csv(index=False).encode('utf-8')
-                        st.download_button("Download CSV", csv_data, f"{fname}.csv", "text/csv", use_container_width=True)
+                        st.download_button("Download CSV",
+                                           lambda: csv_bytes(filtered.drop(columns=['id'] if 'id' in filtered else [])),
+                                           f"{fname}.csv", "text/csv", use_container_width=True)
 
                     with c2:
-                        if selected_client != "All Clients":
-                            pdf_buf = generate_fancy_pdf_single_client(filtered)
-                            st.download_button("Download PDF", pdf_buf, f"{fname}.pdf", "application/pdf", use_container_width=True)
+                        if not USE_FPDF:
+                            st.info(PDF_UNAVAILABLE_MSG)
+                        elif selected_client != "All Clients":
+                            st.download_button("Download PDF", lambda: generate_fancy_pdf_single_client(filtered),
+                                               f"{fname}.pdf", "application/pdf", use_container_width=True)
                         else:
                             st.info("PDF export for all clients not implemented in this version.")
 
@@ -801,7 +1226,7 @@ elif st.session_state.page == "Reports":
             period = st.selectbox("Select Reporting Period", period_options)
 
             start_date = None
-            end_date = datetime.now()
+            end_date = TODAY
 
             if period == "This Year":
                 start_date = datetime(end_date.year, 1, 1)
@@ -812,47 +1237,48 @@ elif st.session_state.page == "Reports":
                 start_date = col1.date_input("From Date", value=end_date - timedelta(days=365))
                 end_date = col2.date_input("To Date", value=end_date)
 
-            df_loans = load_loans_df()
-            df_exp = load_expenses_df()
-            df_inc = load_other_income_df()
-
             if start_date is not None:
-                start_date = pd.to_datetime(start_date)
-                end_date = pd.to_datetime(end_date)
-                loans_filtered = df_loans[(df_loans['date'] >= start_date) & (df_loans['date'] <= end_date)]
-                expenses_filtered = df_exp[(df_exp['date'] >= start_date) & (df_exp['date'] <= end_date)]
-                income_filtered = df_inc[(df_inc['date'] >= start_date) & (df_inc['date'] <= end_date)]
+                # Whole days, so the cached range loaders get a stable key across reruns
+                start_date = pd.to_datetime(start_date).normalize()
+                end_date = pd.to_datetime(end_date).normalize()
             else:
-                loans_filtered = df_loans
-                expenses_filtered = df_exp
-                income_filtered = df_inc
+                end_date = None
+            loans_filtered = load_loans_df(start_date, end_date)
+            expenses_filtered = load_expenses_df(start_date, end_date)
+            income_filtered = load_other_income_df(start_date, end_date)
 
+            rev = loans_filtered[['interest', 'admin_fees', 'penalty_charged']].sum()
             revenue = {
-                'interest': loans_filtered['interest'].sum(),
-                'admin_fees': loans_filtered['admin_fees'].sum(),
-                'penalty': loans_filtered['penalty_charged'].sum(),
+                'interest': rev['interest'],
+                'admin_fees': rev['admin_fees'],
+                'penalty': rev['penalty_charged'],
             }
 
-            other_income_grouped = income_filtered.groupby('category')['amount'].sum().to_dict()
+            other_income_grouped = income_filtered.groupby('category', sort=False, observed=True)['amount'].sum().to_dict()
             total_other_income = sum(other_income_grouped.values())
 
             total_revenue = revenue['interest'] + revenue['admin_fees'] + revenue['penalty'] + total_other_income
 
-            expenses_grouped = expenses_filtered[expenses_filtered['category'] != "Owner's Equity Contribution"].groupby('category')['amount'].sum().to_dict()
+            # One pass over expenses; capital introduced is split out of the grouped result
+            expenses_grouped = expenses_filtered.groupby('category', sort=False, observed=True)['amount'].sum().to_dict()
+            equity_contribution = expenses_grouped.pop("Owner's Equity Contribution", 0.0)
             total_expenses = sum(expenses_grouped.values())
 
-            equity_df = expenses_filtered[expenses_filtered['category'] == "Owner's Equity Contribution"]
-            equity_contribution = equity_df['amount'].sum() if not equity_df.empty else 0.0
-
             net_operating = total_revenue - total_expenses
             final_position = net_operating + equity_contribution
 
             st.markdown("### Financial Summary")
-            cols = st.columns(4)
-            cols[0].metric("Total Revenue", f"NGN {total_revenue:,.2f}")
-            cols[1].metric("Total Expenses", f"NGN {total_expenses:,.2f}")
-            cols[2].metric("Net Operating Profit", f"NGN {net_operating:,.2f}", delta_color="normal")
-            cols[3].metric("Capital Introduced", f"NGN {equity_contribution:,.2f}")
+            # One element for the four figures instead of a column layout plus four metrics
+            summary_cells = "".join(
+                f'<div><div class="pl-label">{label}</div><div class="pl-value">NGN {value:,.2f}</div></div>'
+                for label, value in [
+                    ("Total Revenue", total_revenue),
+                    ("Total Expenses", total_expenses),
+                    ("Net Operating Profit", net_operating),
+                    ("Capital Introduced", equity_contribution),
+                ]
+            )
+            st.markdown(f'<div class="pl-grid">{summary_cells}</div>', unsafe_allow_html=True)
 
             st.markdown(f"**Final Net Position: NGN {final_position:,.2f}**")
 
@@ -864,7 +1290,7 @@ elif st.session_state.page == "Reports":
                     ])
                     custom_cat = st.text_input("Custom Income Category Name") if inc_category == "Custom" else ""
                     inc_amount = st.number_input("Amount (NGN)", min_value=0.0, step=1000.0, format="%.2f")
-                    inc_date = st.date_input("Date", datetime.today())
+                    inc_date = st.date_input("Date", TODAY)
                     inc_desc = st.text_input("Description (optional)")
 
                     if st.form_submit_button("Record Income"):
@@ -884,7 +1310,7 @@ elif st.session_state.page == "Reports":
                     ])
                     custom_exp = st.text_input("Custom Expense Category Name") if exp_category == "Other" else ""
                     exp_amount = st.number_input("Amount (NGN)", min_value=-1000000000.0, max_value=1000000000.0, step=1000.0, format="%.2f")
-                    exp_date = st.date_input("Date", datetime.today())
+                    exp_date = st.date_input("Date", TODAY)
                     exp_desc = st.text_input("Description (optional)")
 
                     if st.form_submit_button("Record"):
@@ -910,43 +1336,58 @@ elif st.session_state.page == "Reports":
             }
 
             c1, c2 = st.columns(2)
-            today_str = datetime.now().strftime("%Y-%m-%d")
-            fname_pl = f"profit_loss_{period.lower().replace(' ','_')}_{today_str}"
+            fname_pl = f"profit_loss_{period.lower().replace(' ','_')}_{TODAY_STR}"
 
             with c1:
-                pl_flat = {
-                    'Period': period,
-                    'Total Revenue': total_revenue,
-                    'Total Expenses': total_expenses,
-                    'Net Operating Profit': net_operating,
-                    'Owner Equity Contribution': equity_contribution,
-                    'Final Net Position': final_position
-                }
-                pl_flat.update({f"Income - {k}": v for k,v in other_income_grouped.items()})
-                pl_flat.update({f"Expense - {k}": v for k,v in expenses_grouped.items()})
-                pl_df = pd.DataFrame([pl_flat])
-                csv_pl = pl_df.to_csv(index=False).encode('utf-8')
-                st.download_button("Download CSV", csv_pl, f"{fname_pl}.csv", "text/csv", use_container_width=True)
+                def build_pl_csv():
+                    # Only runs when the button is clicked, not on every rerun of the page
+                    pl_flat = {
+                        'Period': period,
+                        'Total Revenue': total_revenue,
+                        'Total Expenses': total_expenses,
+                        'Net Operating Profit': net_operating,
+                        'Owner Equity Contribution': equity_contribution,
+                        'Final Net Position': final_position,
+                        **{f"Income - {k}": v for k, v in other_income_grouped.items()},
+                        **{f"Expense - {k}": v for k, v in expenses_grouped.items()},
+                    }
+                    # One row: the csv module is enough, no DataFrame needed
+                    buf = io.StringIO()
+                    writer = csv.writer(buf, lineterminator='\n')
+                    writer.writerow(pl_flat.keys())
+                    writer.writerow(pl_flat.values())
+                    return buf.getvalue().encode('utf-8')
+                st.download_button("Download CSV", build_pl_csv, f"{fname_pl}.csv", "text/csv", use_container_width=True)
 
             with c2:
-                pdf_pl = generate_profit_loss_pdf(pl_data, period)
-                st.download_button("Download PDF", pdf_pl, f"{fname_pl}.pdf", "application/pdf", use_container_width=True)
+                if USE_FPDF:
+                    st.download_button("Download PDF", lambda: generate_profit_loss_pdf(pl_data, period),
+                                       f"{fname_pl}.pdf", "application/pdf", use_container_width=True)
+                else:
+                    st.info(PDF_UNAVAILABLE_MSG)
 
             st.markdown("**Transactions Preview**")
+            preview = loans_filtered
+            if len(preview) > PREVIEW_ROWS and not st.toggle("Show all transactions", key="pl_preview_all"):
+                # Latest loans only (frame is ordered by sn), so a long period doesn't ship the whole book
+                preview = preview.tail(PREVIEW_ROWS)
+                st.caption(f"Showing the latest {PREVIEW_ROWS} of {len(loans_filtered)} transactions")
             st.dataframe(
-                loans_filtered.drop(columns=['id'] if 'id' in loans_filtered else []),
+                preview.drop(columns=['id'] if 'id' in preview else []),
                 use_container_width=True
             )
 
+            # Formatted in the browser, instead of a Styler walking every cell here
+            amount_config = {'amount': st.column_config.NumberColumn(format="accounting")}
             col_exp1, col_exp2 = st.columns(2)
             with col_exp1:
                 if not expenses_filtered.empty:
                     st.markdown("**Expense Details**")
-                    st.dataframe(expenses_filtered.style.format(precision=2, thousands=","), use_container_width=True)
+                    st.dataframe(expenses_filtered, use_container_width=True, column_config=amount_config)
             with col_exp2:
                 if not income_filtered.empty:
                     st.markdown("**Other Income Details**")
-                    st.dataframe(income_filtered.style.format(precision=2, thousands=","), use_container_width=True)
+                    st.dataframe(income_filtered, use_container_width=True, column_config=amount_config)
 
     else:
         general_login_form()
@@ -963,7 +1404,7 @@ elif st.session_state.page == "Add Loan":
             col1, col2 = st.columns(2)
             with col1:
                 name = st.text_input("Client Name *", key="add_loan_name")
-                disp_date = st.date_input("Disbursement Date", datetime.today(), key="add_loan_date")
+                disp_date = st.date_input("Disbursement Date", TODAY, key="add_loan_date")
                 principal = st.number_input("Principal (NGN)", min_value=1000.0, step=5000.0, format="%.0f", key="add_loan_principal")
             with col2:
                 rate_pct = st.number_input("Monthly Interest %", min_value=0.0, step=0.5, value=5.0, key="add_loan_rate")
@@ -975,30 +1416,19 @@ elif st.session_state.page == "Add Loan":
 
             if submitted:
                 if name.strip() and principal > 0:
-                    i_val, p_val, t_val, gt_val, b_val = calculate_loan_fields(
-                        principal, rate_pct, months, admin_fee, already_paid, disp_date
-                    )
-                    current_df = load_loans_df()
-                    sn_next = int(current_df['sn'].max() if not current_df.empty else 0) + 1
-
                     new_row = pd.DataFrame([{
-                        'sn': sn_next,
                         'names': name.strip(),
-                        'date': pd.to_datetime(disp_date),
+                        'date': disp_date,
                         'amount': principal,
                         'int_rate': rate_pct,
                         'duration': months,
                         'admin_fees': admin_fee,
-                        'interest': i_val,
-                        'penalty_charged': p_val,
-                        'total': t_val,
-                        'g_total': gt_val,
-                        'amt_remitted': already_paid,
-                        'balance': b_val
+                        'amt_remitted': already_paid
                     }])
+                    # Fields come from the widget date itself, as calculate_loan_fields would see it
+                    new_row = calculate_loan_fields_vec(new_row).assign(date=pd.to_datetime(disp_date))
 
-                    updated_df = pd.concat([current_df, new_row], ignore_index=True)
-                    save_loans_df(updated_df)
+                    sn_next, = append_loans_df(new_row)
 
                     st.success(f"Loan saved successfully! SN = {sn_next}")
                     st.session_state.add_success_msg = True
@@ -1010,8 +1440,7 @@ elif st.session_state.page == "Add Loan":
             st.session_state.add_success_msg = False
             for k in ["add_loan_name", "add_loan_date", "add_loan_principal",
                       "add_loan_rate", "add_loan_months", "add_loan_admin", "add_loan_paid"]:
-                if k in st.session_state:
-                    del st.session_state[k]
+                st.session_state.pop(k, None)
             st.rerun()
 
     else:
@@ -1022,8 +1451,7 @@ elif st.session_state.page == "Edit Loans":
     if st.session_state.edit_loan_auth:
         st.header("Edit / Delete Loan Record")
 
-        # Force fresh data load on page entry
-        st.cache_data.clear()  # Extra safety
+        # The loan writers clear their loaders, so this is a cache hit unless the book changed
         df = load_loans_df()
 
         if df.empty:
@@ -1039,16 +1467,14 @@ elif st.session_state.page == "Edit Loans":
                 if st.button("Find", type="primary", use_container_width=True):
                     st.rerun()
 
-            candidates = df.copy()
+            candidates = df
 
             if search_query.strip():
                 try:
                     sn_search = int(search_query.strip())
                     candidates = candidates[candidates['sn'] == sn_search]
                 except ValueError:
-                    candidates = candidates[
-                        candidates['names'].str.contains(search_query.strip(), case=False, na=False)
-                    ]
+                    candidates = search_loans(search_query.strip())
 
             if search_query.strip() and candidates.empty:
                 st.warning("No matching records found.")
@@ -1058,8 +1484,8 @@ elif st.session_state.page == "Edit Loans":
 
                 if len(candidates) > 1:
                     st.info(f"Found {len(candidates)} matching records. Please select one:")
-                    display_choice = candidates[['sn', 'names', 'date', 'amount', 'balance']].copy()
-                    display_choice['date'] = display_choice['date'].dt.strftime('%Y-%m-%d')
+                    display_choice = candidates[['sn', 'names', 'date', 'amount', 'balance']]
+                    display_choice = display_choice.assign(date=display_choice['date'].dt.strftime('%Y-%m-%d'))
                     display_choice = display_choice.rename(columns={
                         'sn': 'SN',
                         'names': 'Client',
@@ -1092,18 +1518,7 @@ elif st.session_state.page == "Edit Loans":
                             )
                             if st.button("Yes, Delete Permanently", type="primary", use_container_width=True):
                                 sn_to_delete = int(selected_row['sn'])
-                                # Load fresh data
-                                current_df = load_loans_df()
-
-                                # Drop the row with matching sn
-                                updated_df = current_df[current_df['sn'] != sn_to_delete].copy()
-
-                                # Save the modified dataframe back
-                                save_loans_df(updated_df)
-
-                                # Clean session state
-                                if 'df' in st.session_state:
-                                    del st.session_state.df
+                                delete_loan(sn_to_delete)
 
                                 st.success(f"Record SN {sn_to_delete} – {selected_row['names']} deleted successfully.")
                                 st.rerun()
@@ -1119,7 +1534,7 @@ elif st.session_state.page == "Edit Loans":
                             edit_name = st.text_input("Client Name", value=selected_row['names'], key=f"edit_name_{selected_row['sn']}")
                             edit_date = st.date_input(
                                 "Disbursement Date",
-                                value=selected_row['date'].date() if pd.notnull(selected_row['date']) else datetime.today().date(),
+                                value=selected_row['date'].date() if pd.notnull(selected_row['date']) else TODAY.date(),
                                 key=f"edit_date_{selected_row['sn']}"
                             )
                             edit_amount = st.number_input("Principal (NGN)", value=float(selected_row['amount']), min_value=0.0, step=1000.0, key=f"edit_amount_{selected_row['sn']}")
@@ -1139,20 +1554,19 @@ elif st.session_state.page == "Edit Loans":
                                 help="If > 0: forces balance to 0 and adds penalty to total"
                             )
 
+                            # Computed once per rerun; the Save branch below writes these same figures
                             pure_interest = edit_amount * (edit_rate / 100) * edit_duration
 
                             if edit_penalty > 0:
-                                total_add = edit_admin_fee + pure_interest + edit_penalty
+                                final_penalty = edit_penalty
+                                total_add = edit_admin_fee + pure_interest + final_penalty
                                 g_total = edit_amount + total_add
                                 final_balance = 0.0
                                 note = "(Manual penalty mode – balance forced to 0)"
                             else:
-                                _, auto_penalty, auto_total_add, auto_g_total, auto_balance = calculate_loan_fields(
+                                _, final_penalty, total_add, g_total, final_balance = calculate_loan_fields(
                                     edit_amount, edit_rate, edit_duration, edit_admin_fee, edit_remitted, edit_date
                                 )
-                                total_add = auto_total_add
-                                g_total = auto_g_total
-                                final_balance = auto_balance
                                 note = "(Automatic calculation)"
 
                             st.markdown(f"**Preview** {note}")
@@ -1163,39 +1577,12 @@ elif st.session_state.page == "Edit Loans":
                             st.metric("Outstanding Balance", f"NGN {final_balance:,.2f}", delta_color="inverse")
 
                         if st.form_submit_button("Save Changes", type="primary", use_container_width=True):
-                            pure_interest = edit_amount * (edit_rate / 100) * edit_duration
-
-                            if edit_penalty > 0:
-                                final_penalty = edit_penalty
-                                total_add = edit_admin_fee + pure_interest + final_penalty
-                                g_total = edit_amount + total_add
-                                balance = 0.0
-                            else:
-                                _, final_penalty, total_add, g_total, balance = calculate_loan_fields(
-                                    edit_amount, edit_rate, edit_duration, edit_admin_fee, edit_remitted, edit_date
-                                )
-
-                            # Reload fresh copy for edit
-                            fresh_df = load_loans_df()
-                            mask = fresh_df['sn'] == selected_row['sn']
-
-                            fresh_df.loc[mask, 'names']           = edit_name.strip()
-                            fresh_df.loc[mask, 'date']            = pd.to_datetime(edit_date)
-                            fresh_df.loc[mask, 'amount']          = edit_amount
-                            fresh_df.loc[mask, 'int_rate']        = edit_rate
-                            fresh_df.loc[mask, 'duration']        = edit_duration
-                            fresh_df.loc[mask, 'admin_fees']      = edit_admin_fee
-                            fresh_df.loc[mask, 'amt_remitted']    = edit_remitted
-                            fresh_df.loc[mask, 'interest']        = round(pure_interest, 2)
-                            fresh_df.loc[mask, 'penalty_charged'] = round(final_penalty, 2)
-                            fresh_df.loc[mask, 'total']           = round(total_add, 2)
-                            fresh_df.loc[mask, 'g_total']         = round(g_total, 2)
-                            fresh_df.loc[mask, 'balance']         = round(max(balance, 0), 2)
-
-                            save_loans_df(fresh_df)
-                            if 'df' in st.session_state:
-                                del st.session_state.df
-                            st.session_state.df = fresh_df
+                            update_loan(int(selected_row['sn']), [
+                                edit_name.strip(), edit_date.strftime('%Y-%m-%d'), edit_amount, edit_rate,
+                                edit_duration, edit_admin_fee, edit_remitted, round(pure_interest, 2),
+                                round(final_penalty, 2), round(total_add, 2), round(g_total, 2),
+                                round(max(final_balance, 0), 2),
+                            ])
 
                             st.markdown(
                                 f"""
@@ -1227,9 +1614,10 @@ elif st.session_state.page == "Admin Controls":
 
                 if submitted:
                     if new_username.strip() and new_password.strip():
-                        if add_new_user(new_username.strip(), new_password.strip()):
+                        with st.spinner("Creating user..."):
+                            created = add_new_user(new_username.strip(), new_password.strip())
+                        if created:
                             st.success(f"User '{new_username}' created successfully")
-                            st.cache_data.clear()
                             st.rerun()
                         else:
                             st.error("Username already exists")
@@ -1240,13 +1628,13 @@ elif st.session_state.page == "Admin Controls":
             st.subheader("Existing Users")
             users = load_users_df()
             if not users.empty:
-                for _, user in users.iterrows():
+                for user in users.itertuples(index=False):
                     col_a, col_b = st.columns([4, 1])
-                    col_a.write(f"**{user['username']}** (created {user['created_at'][:10]})")
-                    if user['username'] != st.session_state.get('current_user') and \
-                       st.button("Delete", key=f"del_user_{user['id']}", use_container_width=True):
-                        delete_user(user['id'], st.session_state.current_user)
-                        st.success(f"User {user['username']} deleted")
+                    col_a.write(f"**{user.username}** (created {user.created_at[:10]})")
+                    if user.username != st.session_state.get('current_user') and \
+                       st.button("Delete", key=f"del_user_{user.id}", use_container_width=True):
+                        delete_user(user.id, st.session_state.current_user)
+                        st.success(f"User {user.username} deleted")
                         st.rerun()
             else:
                 st.info("No additional users yet (only default admin)")
@@ -1254,12 +1642,7 @@ elif st.session_state.page == "Admin Controls":
         st.markdown("---")
         st.warning("Irreversible action")
         if st.button("RESET ALL LOAN DATA", type="primary", use_container_width=True):
-            cols = ['id','sn','names','date','amount','int_rate','duration','admin_fees','interest','penalty_charged','total','g_total','amt_remitted','balance']
-            empty_df = pd.DataFrame(columns=cols)
-            save_loans_df(empty_df)
-            if 'df' in st.session_state:
-                del st.session_state.df
-            st.session_state.df = empty_df
+            reset_loans()
             st.success("Loan database cleared")
             st.rerun()
     else:
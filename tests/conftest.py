@@ -0,0 +1,22 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="session")
+def aap(tmp_path_factory):
+    # aap.py is a Streamlit script: importing it runs the page in bare mode and opens
+    # ./loans.db, so import it from a scratch directory to keep the real database untouched
+    workdir = tmp_path_factory.mktemp("app")
+    cwd = os.getcwd()
+    sys.path.insert(0, REPO_DIR)
+    os.chdir(workdir)
+    try:
+        yield importlib.import_module("aap")
+    finally:
+        os.chdir(cwd)
+        sys.path.remove(REPO_DIR)
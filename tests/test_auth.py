@@ -0,0 +1,52 @@
+import time
+
+import bcrypt
+
+
+def test_verify_login_caches_only_successes(aap):
+    cache = aap.get_login_cache()
+    cache.clear()
+    assert aap.verify_login("admin", "wrong") is False
+    assert cache == {}
+    assert aap.verify_login("admin", "password") is True
+    assert [key[0] for key in cache] == ["admin"]
+
+
+def test_verify_login_prunes_expired_entries(aap):
+    cache = aap.get_login_cache()
+    cache.clear()
+    cache[("ghost", b"digest")] = time.time() - aap.LOGIN_CACHE_SECONDS - 1
+    assert aap.verify_login("admin", "wrong") is False
+    assert ("ghost", b"digest") not in cache
+
+
+def test_user_changes_clear_login_cache(aap):
+    cache = aap.get_login_cache()
+    assert aap.verify_login("admin", "password") is True
+    assert aap.add_new_user("cache_probe", "pw") is True
+    assert cache == {}
+
+
+def test_dummy_hash_tracks_bcrypt_rounds(aap):
+    assert aap._bcrypt_cost(aap.get_dummy_hash()) == aap.BCRYPT_ROUNDS
+    assert aap.verify_login("nobody", "x") is False
+
+
+def _stored_hash(aap, username):
+    return aap.get_conn().execute("SELECT password_hash FROM users WHERE username = ?", (username,)).fetchone()[0]
+
+
+def test_login_keeps_stronger_hashes(aap):
+    strong = bcrypt.hashpw(b"pw12", bcrypt.gensalt(rounds=aap.BCRYPT_ROUNDS + 2))
+    aap.get_conn().execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", ("strong", strong))
+    assert aap._check_password("strong", "pw12") is True
+    assert _stored_hash(aap, "strong") == strong
+
+
+def test_login_upgrades_weaker_hashes(aap):
+    weak = bcrypt.hashpw(b"pw4", bcrypt.gensalt(rounds=4))
+    aap.get_conn().execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", ("weak", weak))
+    assert aap._check_password("weak", "pw4") is True
+    upgraded = _stored_hash(aap, "weak")
+    assert aap._bcrypt_cost(upgraded) == aap.BCRYPT_ROUNDS
+    assert bcrypt.checkpw(b"pw4", upgraded)
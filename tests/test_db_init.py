@@ -0,0 +1,69 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def legacy_conn(aap):
+    # What the old to_sql(if_exists='replace') saves left behind: the data columns, no id key
+    conn = sqlite3.connect(":memory:", isolation_level=None)
+    rows = pd.DataFrame([
+        {'sn': 3, 'names': 'ADA OBI', 'date': '2024-03-01', 'amount': 30000.0, 'int_rate': 5.0, 'duration': 3,
+         'admin_fees': 500.0, 'interest': 4500.0, 'penalty_charged': 0.0, 'total': 5000.0, 'g_total': 35000.0,
+         'amt_remitted': 1000.0, 'balance': 34000.0},
+        {'sn': 1, 'names': 'MAGDALENE JAMES', 'date': '2020-12-01', 'amount': 40000.0, 'int_rate': 5.0,
+         'duration': 3, 'admin_fees': 0.0, 'interest': 6000.0, 'penalty_charged': 0.0, 'total': 6000.0,
+         'g_total': 46000.0, 'amt_remitted': 40911.27, 'balance': 5088.73},
+        {'sn': 7, 'names': 'TUNDE BELLO', 'date': None, 'amount': 12500.0, 'int_rate': 7.5, 'duration': 1,
+         'admin_fees': 0.0, 'interest': 937.5, 'penalty_charged': 0.0, 'total': 937.5, 'g_total': 13437.5,
+         'amt_remitted': 0.0, 'balance': 13437.5},
+    ])[aap.LOAN_COLUMNS[1:]]
+    rows.to_sql('loans', conn, if_exists='replace', index=False)
+    yield conn, rows
+    conn.close()
+
+
+def _tables(conn):
+    return {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def test_legacy_loans_table_is_migrated(aap, legacy_conn):
+    conn, rows = legacy_conn
+    aap._apply_schema(conn)
+
+    pk = [col[1] for col in conn.execute("PRAGMA table_info(loans)") if col[5]]
+    assert pk == ['id']
+    assert 'loans_legacy' not in _tables(conn)
+
+    migrated = pd.read_sql_query("SELECT * FROM loans ORDER BY id", conn)
+    # ids are handed out in sn order, and every data column survives untouched
+    assert migrated['sn'].tolist() == [1, 3, 7]
+    assert migrated['id'].tolist() == [1, 2, 3]
+    expected = rows.sort_values('sn').reset_index(drop=True)
+    pd.testing.assert_frame_equal(migrated[aap.LOAN_COLUMNS[1:]], expected, check_dtype=False)
+
+
+def test_apply_schema_is_idempotent(aap, legacy_conn):
+    conn, _ = legacy_conn
+    aap._apply_schema(conn)
+    before = conn.execute("SELECT * FROM loans ORDER BY id").fetchall()
+    aap._apply_schema(conn)
+    assert conn.execute("SELECT * FROM loans ORDER BY id").fetchall() == before
+    assert {'loans', 'expenses', 'other_income', 'users'} <= _tables(conn)
+
+
+def test_stored_dates_are_normalised(aap):
+    conn = sqlite3.connect(":memory:", isolation_level=None)
+    aap._apply_schema(conn)
+    stored = ['2024-05-01 00:00:00', '2024-05-02T10:30:00', '2024-05-03', 'not a date', None]
+    conn.executemany("INSERT INTO loans (sn, names, date) VALUES (?, 'X', ?)", enumerate(stored, start=1))
+    conn.execute("INSERT INTO expenses (category, amount, date) VALUES ('Allowances', 10.0, '2024-06-01 00:00:00')")
+
+    aap._normalise_stored_dates(conn)
+
+    assert [d for (d,) in conn.execute("SELECT date FROM loans ORDER BY sn")] == [
+        '2024-05-01', '2024-05-02', '2024-05-03', 'not a date', None
+    ]
+    assert conn.execute("SELECT date FROM expenses").fetchone() == ('2024-06-01',)
+    assert not conn.in_transaction
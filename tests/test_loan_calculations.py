@@ -0,0 +1,81 @@
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+
+def test_months_overdue_widget_date_counts_as_not_overdue(aap):
+    # st.date_input returns a bare datetime.date; it has never accrued an automatic penalty
+    assert aap.months_overdue(date(2020, 12, 1), 3) == 0
+    assert aap.months_overdue(date.today() - timedelta(days=400), 1) == 0
+
+
+def test_months_overdue_text_and_timestamp_dates(aap):
+    start = datetime.now() - timedelta(days=200)
+    # due 91 days after start, so 109 days late -> 3 whole months
+    assert aap.months_overdue(start.strftime("%Y-%m-%d"), 3) == 3
+    assert aap.months_overdue(pd.Timestamp(start.date()), 3) == 3
+    assert aap.months_overdue(start, 12) == 0
+    assert aap.months_overdue("not a date", 3) == 0
+    assert aap.months_overdue(pd.NaT, 3) == 0
+
+
+def test_calculate_loan_fields_with_widget_date(aap):
+    assert aap.calculate_loan_fields(10000.0, 5.0, 3, 0.0, 0.0, date(2024, 1, 1)) == (
+        1500.0, 0.0, 1500.0, 11500.0, 11500.0
+    )
+    assert aap.calculate_loan_fields(10000.0, 5.0, 3, 0.0, 500.0, date(2024, 1, 1))[-1] == 11000.0
+    assert aap.calculate_loan_fields(40000.0, 5.0, 3, 0.0, 40911.27, date(2020, 12, 1)) == (
+        6000.0, 0.0, 6000.0, 46000.0, 5088.73
+    )
+
+
+def _rows_match_scalar(aap, frame):
+    result = aap.calculate_loan_fields_vec(frame)
+    for row, out in zip(frame.itertuples(index=False), result.itertuples(index=False)):
+        expected = aap.calculate_loan_fields(
+            row.amount, row.int_rate, row.duration, row.admin_fees, row.amt_remitted, row.date
+        )
+        assert (out.interest, out.penalty_charged, out.total, out.g_total, out.balance) == expected, row
+
+
+def _loan_frame(dates):
+    n = len(dates)
+    return pd.DataFrame({
+        'date': dates,
+        'amount': [10000.0, 40000.0, 2500.0, 125000.0, 7300.0, 60000.0][:n],
+        'int_rate': [5.0, 5.0, 7.5, 4.0, 0.0, 6.0][:n],
+        'duration': [3, 3, 1, 12, 2, 6][:n],
+        'admin_fees': [0.0, 1000.0, 250.0, 0.0, 100.0, 0.0][:n],
+        # the 40000 loan is overpaid, so its penalty is waived
+        'amt_remitted': [0.0, 50000.0, 500.0, 20000.0, 0.0, 1234.56][:n],
+    })
+
+
+def test_calculate_loan_fields_vec_matches_scalar_for_stored_dates(aap):
+    now = datetime.now()
+    dates = pd.Series(pd.to_datetime([
+        now - timedelta(days=900), now - timedelta(days=400), now - timedelta(days=45),
+        now - timedelta(days=10), pd.NaT, now + timedelta(days=30),
+    ]).normalize())
+    _rows_match_scalar(aap, _loan_frame(dates))
+
+
+def test_calculate_loan_fields_vec_matches_scalar_for_mixed_dates(aap):
+    now = datetime.now()
+    dates = pd.Series([
+        date(2024, 1, 1),                                     # widget date: never overdue
+        (now - timedelta(days=400)).strftime("%Y-%m-%d"),
+        pd.Timestamp((now - timedelta(days=200)).date()),
+        "2024-13-40",
+        None,
+        date.today() - timedelta(days=30),
+    ], dtype=object)
+    _rows_match_scalar(aap, _loan_frame(dates))
+
+
+def test_calculate_loan_fields_vec_add_loan_figures(aap):
+    # what Add Loan stores for a 10,000 loan over 3 months dated 2024-01-01
+    out = aap.calculate_loan_fields_vec(_loan_frame(pd.Series([date(2024, 1, 1)], dtype=object)))
+    assert out.loc[0, ['interest', 'penalty_charged', 'total', 'g_total', 'balance']].tolist() == [
+        1500.0, 0.0, 1500.0, 11500.0, 11500.0
+    ]